@@ -0,0 +1,288 @@
+"""
+Preprocessing Benchmark
+Times get_prediction as it is now against a frozen copy of the old float64 version
+(float64 model input, uint8 round trip and float64 HSV in the heuristics, fresh Dirichlet arrays).
+Both run on the same models (or the same fallback when none are trained), so the difference is
+the preprocessing path. Reports per-request time and memory allocated per request (tracemalloc).
+"""
+
+import argparse
+import hashlib
+import io
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from model_service import get_prediction, load_models, get_disease_info
+
+
+# ---- Frozen copy of the pre-uint8 pipeline, kept only as the baseline for this benchmark ----
+
+def legacy_visual_heuristics(img_array, filename=""):
+    """
+    Improved Visual Analysis: Health analysis runs even if plant is pre-identified.
+    """
+    name_lower = filename.lower()
+    suggested_plant = None 
+    if any(k in name_lower for k in ["pepper", "bell", "paper"]):
+        suggested_plant = "Pepper__bell"
+    elif any(k in name_lower for k in ["tomato", "tomo", "tmo"]):
+        suggested_plant = "Tomato"
+    elif any(k in name_lower for k in ["potato", "pota", "potat"]):
+        suggested_plant = "Potato"
+    img_pil = Image.fromarray((img_array * 255).astype(np.uint8))
+    hsv = np.array(img_pil.convert("HSV")) / 255.0
+    h, s, v = hsv[:,:,0], hsv[:,:,1], hsv[:,:,2]
+    mean_h, mean_s, mean_v = np.mean(h), np.mean(s), np.mean(v)
+    leaf_mask = (s > 0.15) & (v > 0.15)
+    leaf_pixels = h[leaf_mask]
+    if leaf_pixels.size < 100:
+        leaf_pixels = h.flatten()
+        leaf_s = s.flatten()
+        leaf_v = v.flatten()
+    else:
+        leaf_s = s[leaf_mask]
+        leaf_v = v[leaf_mask]
+    leaf_mean_s = np.mean(leaf_s)
+    leaf_mean_v = np.mean(leaf_v)
+    variance = np.var(leaf_v)    
+    if suggested_plant is None:
+        suggested_plant = "Tomato"       
+        if leaf_mean_s > 0.42 and variance < 0.025:
+             suggested_plant = "Pepper__bell"
+        elif 0.35 < mean_h < 0.45 and leaf_mean_v > 0.5:
+            suggested_plant = "Potato"        
+    health = "healthy"
+    nudge_type = "None"    
+    brown_mask = ((leaf_pixels < 0.15) | (leaf_pixels > 0.85)) & (leaf_v < 0.65)
+    brown_ratio = np.sum(brown_mask) / leaf_pixels.size
+    yellow_mask = (leaf_pixels > 0.08) & (leaf_pixels < 0.23) & (leaf_s < 0.55)
+    yellow_ratio = np.sum(yellow_mask) / leaf_pixels.size
+    green_mask = (leaf_pixels > 0.24) & (leaf_pixels < 0.48) & (leaf_s > 0.25)
+    green_ratio = np.sum(green_mask) / leaf_pixels.size
+    is_spotted = variance > 0.04 and brown_ratio > 0.02
+    if "healthy" in name_lower:
+        health = "healthy"
+        nudge_type = "None"
+    elif "mold" in name_lower:
+        health = "diseased"
+        nudge_type = "Leaf_Mold"
+    elif "septoria" in name_lower:
+        health = "diseased"
+        nudge_type = "Septoria_leaf_spot"
+    elif brown_ratio > 0.04 or is_spotted:
+        health = "diseased"
+        if "pepper" in suggested_plant.lower() or "bell" in name_lower:
+            nudge_type = "Bacterial_spot"
+        else:
+            nudge_type = "Late_Blight" if brown_ratio > 0.15 else "Early_Blight"
+    elif yellow_ratio > 0.25 or (yellow_ratio > 0.12 and suggested_plant == "Tomato"):
+        health = "diseased"
+        if suggested_plant == "Tomato":
+            nudge_type = "Leaf_Mold" if yellow_ratio < 0.2 else "Tomato_Yellow_Leaf_Curl_Virus"
+        else:
+            nudge_type = "Leaf_Mold"
+    elif green_ratio > 0.85 and brown_ratio < 0.02:
+        health = "healthy"
+        nudge_type = "None"
+    elif leaf_mean_s < 0.18:
+        health = "diseased"
+        nudge_type = "Spider_mites"
+    else:
+        health = "healthy"
+        nudge_type = "None"
+    return {
+        "suggested_plant": suggested_plant,
+        "health": health,
+        "nudge_type": nudge_type,
+        "metrics": {"h": mean_h, "s": leaf_mean_s, "v": leaf_mean_v, "green": green_ratio, "brown": brown_ratio, "var": variance}
+    }
+def legacy_get_prediction(image_bytes, model_name="Ensemble", filename=""):
+    """
+    Hybrid Prediction: ML Probabilities + Deterministic Demo Variance
+    """
+    models, class_names = load_models()
+    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    width, height = img.size
+    img_array = np.array(img.resize((224, 224))) / 255.0
+    input_batch = np.expand_dims(img_array, axis=0)
+    clean_model = model_name.split(" ")[0].strip()
+    if "(" in clean_model: clean_model = clean_model.split("(")[0].strip()
+    img_hash = int(hashlib.md5(image_bytes).hexdigest(), 16)
+    np.random.seed(img_hash % 4294967295)
+    visual = legacy_visual_heuristics(img_array, filename=filename)    
+    name_low = filename.lower()
+    has_keyword = any(k in name_low for k in ["tomato", "tomo", "tmo", "potato", "pota", "pepper", "bell", "paper"])
+    if not has_keyword and visual["suggested_plant"] == "Tomato":
+        aspect = width / height
+        if aspect < 0.8:
+            visual["suggested_plant"] = "Pepper__bell"
+        elif 0.95 < aspect < 1.1: 
+            visual["suggested_plant"] = "Potato"    
+    predictions = {}
+    for name in ["EfficientNetV2", "ResNet50V2", "MobileNetV3"]:
+        if name in models:
+            try:
+                raw_pred = models[name].predict(input_batch, verbose=0)[0]
+                predictions[name] = raw_pred
+            except:
+                predictions[name] = np.random.dirichlet(np.ones(len(class_names)), size=1)[0]
+        else:
+            predictions[name] = np.random.dirichlet(np.ones(len(class_names)), size=1)[0]
+    if model_name == "Ensemble":
+        combined_pred = np.mean(list(predictions.values()), axis=0)
+    else:
+        combined_pred = predictions.get(model_name, list(predictions.values())[0])
+    variety_score = np.zeros(len(class_names))
+    target_plant = visual["suggested_plant"].lower()
+    for i, label in enumerate(class_names):
+        label_low = label.lower()        
+        if target_plant in label_low:
+            variety_score[i] += 10.0            
+        if visual["health"] == "diseased":
+            if "healthy" in label_low:
+                variety_score[i] -= 5.0
+            if visual["nudge_type"] != "None":
+                if visual["nudge_type"].lower().replace("_", " ") in label_low.replace("_", " "):
+                    variety_score[i] += 2.0
+                else:
+                    variety_score[i] += 0.2
+            else:
+                variety_score[i] += 0.5
+        else:
+            if "healthy" in label_low:
+                variety_score[i] += 2.0
+            else:
+                variety_score[i] -= 2.0
+                
+        variety_score[i] += (np.random.random() * 0.1)
+
+    final_score = (combined_pred * 0.1) + variety_score
+    class_idx = int(np.argmax(final_score))    
+    class_label = class_names[class_idx]
+    
+    if "Ensemble" in model_name: 
+        raw_prob = combined_pred[class_idx]
+    else:
+        raw_prob = predictions.get(clean_model, combined_pred)[class_idx]
+    
+    display_confidence = 75.0 + (raw_prob * 24.9)
+    if "MobileNet" in clean_model: 
+        display_confidence -= (1.5 + (img_hash % 20) / 10.0) 
+    elif "ResNet" in clean_model:
+        display_confidence -= (0.5 + (img_hash % 10) / 10.0) 
+        
+    if visual["suggested_plant"].lower() in class_label.lower():
+         display_confidence += 2.0 
+         
+    display_confidence = min(99.95, max(75.0, display_confidence))
+    if "___" in class_label:
+        plant, disease = class_label.split("___", 1)
+    elif "__" in class_label:
+        plant, disease = class_label.split("__", 1)
+    else:
+        parts = class_label.split("_", 1)
+        plant = parts[0]
+        disease = parts[1] if len(parts) > 1 else "healthy"
+        
+    plant_clean = plant.replace("__", " ").replace("_", " ").strip()
+    disease_clean = disease.replace("_", " ").strip()
+    
+    if plant_clean.lower() in disease_clean.lower():
+        disease_clean = disease_clean.lower().replace(plant_clean.lower(), "").strip()
+
+    info = get_disease_info(plant, disease)
+    
+    # Confidence breakdown
+    breakdown = {}
+    for mod_name, pred_arr in predictions.items():
+        # Raw probability of the WINNING class
+        p_val = pred_arr[class_idx]
+        
+        # Scale for display
+        b_score = 75.0 + (p_val * 24.9)
+        
+        # Personality Bias in Breakdown
+        if "MobileNet" in mod_name: b_score -= 2.5
+        if "ResNet" in mod_name: b_score -= 1.0
+        
+        # Consistent heuristic bonus
+        if visual["suggested_plant"].lower() in class_label.lower():
+             b_score += 2.0
+             
+        breakdown[mod_name] = min(99.9, b_score)
+
+    return {
+        "status": "success",
+        "model_used": model_name,
+        "plant": plant.replace("__", " "),
+        "disease": disease.capitalize(),
+        "accuracy": round(display_confidence, 2),
+        "description": info["description"],
+        "treatment": info["treatment"],
+        "confidence_breakdown": breakdown
+    }
+
+
+# ---- End of frozen copy ----
+
+
+def measure(fn, images, repeat):
+    """Return (mean ms per request, mean peak KiB allocated per request)"""
+    for image_bytes in images[:5]:
+        fn(image_bytes)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for image_bytes in images:
+            fn(image_bytes)
+    elapsed_ms = (time.perf_counter() - start) * 1000 / (repeat * len(images))
+    peaks = []
+    tracemalloc.start()
+    for image_bytes in images:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = fn(image_bytes)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+        del result
+    tracemalloc.stop()
+    return elapsed_ms, np.mean(peaks) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image preprocessing for get_prediction")
+    parser.add_argument("--dataset", default="PlantVillage")
+    parser.add_argument("--images", type=int, default=50, help="Number of images to sample")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    paths = sorted(Path(args.dataset).glob("*/*.jpg"))[::7][:args.images]
+    if not paths:
+        print(f" No images found under {args.dataset}/")
+        exit(1)
+    images = [p.read_bytes() for p in paths]
+    load_models()
+    # Same plant/disease from both paths, otherwise the timings compare different work
+    label = lambda r: (r["plant"], r["disease"])
+    mismatched = [
+        p.name for p, image_bytes in zip(paths, images)
+        if label(legacy_get_prediction(image_bytes)) != label(get_prediction(image_bytes))
+    ]
+    if mismatched:
+        print(f" Warning: predictions differ from the legacy path for {len(mismatched)} images")
+    print(f" Benchmarking get_prediction on {len(images)} images x {args.repeat} runs")
+    results = {
+        "legacy (float64)": measure(legacy_get_prediction, images, args.repeat),
+        "current (uint8/float32)": measure(get_prediction, images, args.repeat),
+    }
+    print(f"\n   {'Path':25s} {'ms/request':>10s} {'KiB allocated':>14s}")
+    for name, (ms, kib) in results.items():
+        print(f"   {name:25s} {ms:10.3f} {kib:14.1f}")
+    (old_ms, old_kib), (new_ms, new_kib) = results.values()
+    print(f"\n   Time: {(1 - new_ms / old_ms) * 100:.1f}% faster, allocations: {(1 - new_kib / old_kib) * 100:.1f}% smaller")
+
+
+if __name__ == "__main__":
+    main()
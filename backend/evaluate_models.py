@@ -0,0 +1,330 @@
+"""
+Offline Bulk Evaluation
+Scores every image in a PlantVillage/-style tree with a process pool and batched inference,
+either through the full get_prediction pipeline or through the raw per-model outputs.
+Per-image results go to a columnar .npz file; a report with per-class precision/recall,
+the confusion matrix and throughput figures is written next to it.
+Re-running with --resume only scores images that are new or changed since the last run.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from thread_config import load_thread_config, apply_env
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png"}
+RAW_MODELS = ["EfficientNetV2", "ResNet50V2", "MobileNetV3"]
+# pred_label of images that could not be decoded or scored; kept out of the metrics
+ERROR_LABEL = "__error__"
+COLUMNS = ["path", "true_label", "pred_label", "confidence", "size", "mtime_ns", "latency_ms"]
+
+_worker = {}
+
+
+def scan_dataset(dataset_dir):
+    """List (relative path, class folder, size, mtime_ns) for every image in the tree"""
+    dataset_dir = Path(dataset_dir)
+    entries = []
+    for folder in sorted(d for d in dataset_dir.iterdir() if d.is_dir()):
+        for img_path in sorted(folder.iterdir()):
+            if img_path.suffix.lower() not in IMAGE_EXTS:
+                continue
+            st = img_path.stat()
+            entries.append((img_path.relative_to(dataset_dir).as_posix(), folder.name, st.st_size, st.st_mtime_ns))
+    return entries
+
+
+def load_results(path):
+    """Load a previous results file, returning (columns, meta) or (None, None)"""
+    if not os.path.exists(path):
+        return None, None
+    with np.load(path, allow_pickle=False) as data:
+        columns = {k: data[k] for k in COLUMNS}
+        meta = json.loads(str(data["meta"]))
+    return columns, meta
+
+
+def save_results(path, rows, meta):
+    """Write rows as one array per column; the file is replaced atomically so a crash never corrupts it"""
+    rows = sorted(rows, key=lambda r: r[0])
+    columns = {
+        "path": np.array([r[0] for r in rows], dtype=str),
+        "true_label": np.array([r[1] for r in rows], dtype=str),
+        "pred_label": np.array([r[2] for r in rows], dtype=str),
+        "confidence": np.array([r[3] for r in rows], dtype=np.float32),
+        "size": np.array([r[4] for r in rows], dtype=np.int64),
+        "mtime_ns": np.array([r[5] for r in rows], dtype=np.int64),
+        "latency_ms": np.array([r[6] for r in rows], dtype=np.float32),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, meta=np.array(json.dumps(meta)), **columns)
+    os.replace(tmp_path, path)
+
+
+def _init_worker(dataset_dir, mode, model_name, ready):
+    """Load models once per worker process, then signal `ready` so the parent can start the clock"""
+    import model_service
+    models, class_names = model_service.load_models()
+    _worker.update(dataset_dir=dataset_dir, mode=mode, model_name=model_name, error=None,
+                   input_size=model_service.INPUT_SIZE, load_image=model_service.load_image,
+                   to_model_input=model_service.to_model_input)
+    if mode == "pipeline":
+        # get_prediction reports the display form of the label, map it back to the folder name
+        lookup = {}
+        for label in class_names:
+            plant, disease = model_service.split_class_label(label)
+            lookup[(plant.replace("__", " "), disease.capitalize())] = label
+        _worker.update(get_prediction=model_service.get_prediction, lookup=lookup)
+    else:
+        names = RAW_MODELS if model_name == "Ensemble" else [model_name]
+        selected = [models[n] for n in names if n in models]
+        if not selected:
+            _worker["error"] = f"No trained weights found for {', '.join(names)} - raw mode needs real models"
+        _worker.update(models=selected, class_names=class_names)
+    ready.release()
+
+
+def _noop():
+    """Submitted once per worker so the pool starts every process before scoring begins"""
+    return os.getpid()
+
+
+def _score_batch(batch):
+    """Score a batch of (relative path, ...) entries, returning (path, pred_label, confidence, latency_ms)"""
+    if _worker["error"]:
+        raise RuntimeError(_worker["error"])
+    dataset_dir = _worker["dataset_dir"]
+    results = []
+    if _worker["mode"] == "pipeline":
+        for rel_path, *_ in batch:
+            try:
+                with open(os.path.join(dataset_dir, rel_path), "rb") as f:
+                    image_bytes = f.read()
+                start = time.perf_counter()
+                # Only the basename is passed so the class folder never leaks into the filename heuristics
+                result = _worker["get_prediction"](image_bytes, _worker["model_name"], filename=os.path.basename(rel_path))
+                latency_ms = (time.perf_counter() - start) * 1000
+            except Exception as e:
+                print(f"   Skipped {rel_path}: {e}")
+                results.append((rel_path, ERROR_LABEL, 0.0, 0.0))
+                continue
+            label = _worker["lookup"].get((result["plant"], result["disease"]), f"{result['plant']}___{result['disease']}")
+            results.append((rel_path, label, result["accuracy"] / 100.0, latency_ms))
+        return results
+    start = time.perf_counter()
+    # Reuse one float32 batch buffer per worker; each image is decoded to uint8 and scaled straight into it
+    if len(_worker.get("batch", ())) < len(batch):
+        _worker["batch"] = np.empty((len(batch),) + _worker["input_size"] + (3,), dtype=np.float32)
+    loaded = []
+    for entry in batch:
+        try:
+            with open(os.path.join(dataset_dir, entry[0]), "rb") as f:
+                img_array, _ = _worker["load_image"](f.read())
+            _worker["to_model_input"](img_array, out=_worker["batch"][len(loaded)])
+            loaded.append(entry)
+        except Exception as e:
+            print(f"   Skipped {entry[0]}: {e}")
+            results.append((entry[0], ERROR_LABEL, 0.0, 0.0))
+    if not loaded:
+        return results
+    input_batch = _worker["batch"][:len(loaded)]
+    probs = np.mean([m.predict(input_batch, batch_size=len(loaded), verbose=0) for m in _worker["models"]], axis=0)
+    latency_ms = (time.perf_counter() - start) * 1000 / len(loaded)
+    class_names = _worker["class_names"]
+    for entry, row in zip(loaded, probs):
+        idx = int(np.argmax(row))
+        results.append((entry[0], class_names[idx], float(row[idx]), latency_ms))
+    return results
+
+
+def build_report(rows, class_labels):
+    """Per-class precision/recall and the confusion matrix (rows = actual, columns = predicted)"""
+    failed = [r[0] for r in rows if r[2] == ERROR_LABEL]
+    rows = [r for r in rows if r[2] != ERROR_LABEL]
+    labels = list(class_labels)
+    for r in rows:
+        if r[2] not in labels:
+            labels.append(r[2])
+    index = {label: i for i, label in enumerate(labels)}
+    matrix = np.zeros((len(labels), len(labels)), dtype=np.int64)
+    for r in rows:
+        matrix[index[r[1]], index[r[2]]] += 1
+    true_pos = np.diag(matrix)
+    predicted = matrix.sum(axis=0)
+    support = matrix.sum(axis=1)
+    per_class = {}
+    for i, label in enumerate(labels):
+        precision = true_pos[i] / predicted[i] if predicted[i] else 0.0
+        recall = true_pos[i] / support[i] if support[i] else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        per_class[label] = {
+            "precision": round(float(precision), 4),
+            "recall": round(float(recall), 4),
+            "f1": round(float(f1), 4),
+            "support": int(support[i]),
+        }
+    total = int(matrix.sum())
+    return {
+        "images": total,
+        "accuracy": round(float(true_pos.sum() / total), 4) if total else 0.0,
+        "per_class": per_class,
+        "labels": labels,
+        "confusion_matrix": matrix.tolist(),
+        "failed": failed,
+    }
+
+
+def main():
+    thread_config = load_thread_config()
+    # Spawned workers inherit these before they import numpy/TensorFlow
+    apply_env(thread_config)
+    parser = argparse.ArgumentParser(description="Bulk-evaluate the plant disease models on a PlantVillage-style tree")
+    parser.add_argument("--dataset", default="PlantVillage", help="Folder with one sub-folder per class")
+    parser.add_argument("--mode", choices=["pipeline", "raw"], default="pipeline",
+                        help="pipeline: full get_prediction output, raw: argmax of the model probabilities")
+    parser.add_argument("--model", choices=["Ensemble"] + RAW_MODELS, default="Ensemble")
+    # Workers inherit the tuned intra-op thread count, so size the pool to keep workers x threads within the CPUs
+    cpus = os.cpu_count() or 2
+    default_workers = cpus // thread_config["intra_op_threads"] if "intra_op_threads" in thread_config else cpus // 2
+    parser.add_argument("--workers", type=int, default=max(1, default_workers))
+    parser.add_argument("--batch-size", type=int, default=thread_config.get("batch_size", 32))
+    parser.add_argument("--output", default="evaluation_results.npz")
+    parser.add_argument("--resume", action="store_true",
+                        help="Keep results from the previous run and only score new or changed images")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="Save partial results every N batches")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" Plant Disease Detection - Bulk Evaluation")
+    print("=" * 60)
+    if not os.path.isdir(args.dataset):
+        print(f"\n Dataset folder not found: {args.dataset}")
+        exit(1)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    if args.mode == "raw":
+        from model_service import MODEL_FILES
+        names = RAW_MODELS if args.model == "Ensemble" else [args.model]
+        models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+        if not any(os.path.exists(os.path.join(models_dir, MODEL_FILES[n])) for n in names):
+            print(f"\n No trained weights found for {', '.join(names)} in models/")
+            print("   Raw mode needs real models - run: python train_models.py")
+            exit(1)
+    entries = scan_dataset(args.dataset)
+    class_labels = sorted({e[1] for e in entries})
+    meta = {"mode": args.mode, "model": args.model}
+    print(f"\n Found {len(entries)} images in {len(class_labels)} classes")
+
+    kept = []
+    if args.resume:
+        previous, prev_meta = load_results(args.output)
+        if previous is not None:
+            if prev_meta != meta:
+                print(f"\n {args.output} was produced with {prev_meta}, not {meta}")
+                print("   Use a different --output or drop --resume")
+                exit(1)
+            prev = {
+                p: (t, pl, float(c), int(s), int(m), float(l))
+                for p, t, pl, c, s, m, l in zip(*(previous[k] for k in COLUMNS))
+            }
+            for rel_path, label, size, mtime_ns in entries:
+                row = prev.get(rel_path)
+                # Failed images are retried on every resume
+                if row and row[0] == label and row[1] != ERROR_LABEL and row[3] == size and row[4] == mtime_ns:
+                    kept.append((rel_path,) + row)
+            print(f"   Reusing {len(kept)} unchanged results from {args.output}")
+    done = {r[0] for r in kept}
+    todo = [e for e in entries if e[0] not in done]
+    fingerprints = {e[0]: e for e in todo}
+    batches = [todo[i:i + args.batch_size] for i in range(0, len(todo), args.batch_size)]
+    print(f"   Scoring {len(todo)} images in {len(batches)} batches with {args.workers} workers ({args.mode} / {args.model})")
+
+    rows = list(kept)
+    new_rows = []
+    workers = min(args.workers, len(batches))
+    startup_time = wall_time = 0.0
+    if batches:
+        # spawn keeps TensorFlow state out of the children; each worker loads its own copy of the models
+        ctx = mp.get_context("spawn")
+        ready = ctx.Semaphore(0)
+        startup_start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(args.dataset, args.mode, args.model, ready)) as pool:
+            # Throughput is timed from when every worker has its models loaded; startup is reported separately
+            warmups = [pool.submit(_noop) for _ in range(workers)]
+            for _ in range(workers):
+                while not ready.acquire(timeout=1):
+                    for w in warmups:
+                        if w.done():
+                            w.result()
+            startup_time = time.perf_counter() - startup_start
+            wall_start = time.perf_counter()
+            futures = [pool.submit(_score_batch, batch) for batch in batches]
+            try:
+                for n, future in enumerate(as_completed(futures), 1):
+                    for rel_path, pred_label, confidence, latency_ms in future.result():
+                        _, true_label, size, mtime_ns = fingerprints[rel_path]
+                        new_rows.append((rel_path, true_label, pred_label, confidence, size, mtime_ns, latency_ms))
+                    print(f"   {n}/{len(batches)} batches", end="\r")
+                    if n % args.checkpoint_every == 0:
+                        save_results(args.output, rows + new_rows, meta)
+            except BaseException:
+                # Keep everything scored so far; --resume picks up from here
+                for f in futures:
+                    f.cancel()
+                save_results(args.output, rows + new_rows, meta)
+                print(f"\n Run aborted, saved {len(new_rows)} new results to {args.output}")
+                raise
+            wall_time = time.perf_counter() - wall_start
+        print()
+    rows += new_rows
+    save_results(args.output, rows, meta)
+    print(f" Saved per-image results to {args.output}")
+
+    report = build_report(rows, class_labels)
+    scored = [r for r in new_rows if r[2] != ERROR_LABEL]
+    latencies = np.array([r[6] for r in scored], dtype=np.float64)
+    report["run"] = {
+        **meta,
+        "workers": workers,
+        "batch_size": args.batch_size,
+        "scored": len(scored),
+        "failed": len(new_rows) - len(scored),
+        "reused": len(kept),
+        "startup_s": round(startup_time, 3),
+        "wall_time_s": round(wall_time, 3),
+        "images_per_s": round(len(scored) / wall_time, 2) if scored else 0.0,
+        "latency_ms_mean": round(float(latencies.mean()), 2) if scored else 0.0,
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 2) if scored else 0.0,
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 2) if scored else 0.0,
+    }
+    stem = os.path.splitext(args.output)[0]
+    with open(f"{stem}_report.json", "w") as f:
+        json.dump(report, f, indent=2)
+    with open(f"{stem}_confusion.csv", "w") as f:
+        f.write("actual\\predicted," + ",".join(report["labels"]) + "\n")
+        for label, counts in zip(report["labels"], report["confusion_matrix"]):
+            f.write(label + "," + ",".join(str(c) for c in counts) + "\n")
+    print(f" Saved report to {stem}_report.json and {stem}_confusion.csv")
+
+    print("\n Per-class results:")
+    print(f"   {'Class':45s} {'Prec':>6s} {'Recall':>6s} {'N':>5s}")
+    for label, stats in report["per_class"].items():
+        print(f"   {label:45s} {stats['precision']:6.3f} {stats['recall']:6.3f} {stats['support']:5d}")
+    run = report["run"]
+    print(f"\n   Accuracy: {report['accuracy'] * 100:.2f}% over {report['images']} images")
+    if report["failed"]:
+        print(f"   Failed: {len(report['failed'])} images could not be scored (listed under \"failed\" in the report)")
+    print(f"   Throughput: {run['images_per_s']:.2f} img/s, latency mean {run['latency_ms_mean']:.1f} ms, "
+          f"p95 {run['latency_ms_p95']:.1f} ms (worker startup {run['startup_s']:.1f} s not included)")
+
+
+if __name__ == "__main__":
+    main()
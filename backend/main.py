@@ -1,9 +1,25 @@
+import time
+_start = time.perf_counter()
+from thread_config import load_thread_config, apply_env
+# Thread counts from tune_threads.py must be in the environment before numpy/TensorFlow load
+THREAD_CONFIG = load_thread_config()
+apply_env(THREAD_CONFIG)
 from fastapi import FastAPI, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from model_service import get_prediction, MODELS
+_fastapi_done = time.perf_counter()
+from model_service import get_prediction, MODELS, STARTUP_TIMINGS, models_ready, preload_models, load_error
 from typing import Optional
-app = FastAPI(title="Plant Disease Detection API")
+from contextlib import asynccontextmanager
+import threading
+STARTUP_TIMINGS["import_fastapi"] = _fastapi_done - _start
+STARTUP_TIMINGS["import_model_service"] = time.perf_counter() - _fastapi_done
+@asynccontextmanager
+async def lifespan(app):
+    # Models load in the background so the API answers (in degraded mode) right away
+    threading.Thread(target=preload_models, daemon=True).start()
+    yield
+app = FastAPI(title="Plant Disease Detection API", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -14,6 +30,17 @@ app.add_middleware(
 @app.get("/")
 async def root():
     return {"message": "Plant Disease Detection API is running"}
+@app.get("/health")
+async def health():
+    # Copy first: the preload thread may still be adding timings
+    timings = dict(STARTUP_TIMINGS)
+    error = load_error()
+    return {
+        "status": "error" if error else "ok",
+        "models_ready": models_ready(),
+        "load_error": error,
+        "startup_timings": {step: round(seconds, 3) for step, seconds in timings.items()}
+    }
 @app.get("/models")
 async def list_models():
     return {"models": list(MODELS.keys()) + ["Ensemble"]}
@@ -23,7 +50,11 @@ async def predict(
     model_name: str = Form("Ensemble")
 ):
     contents = await file.read()
-    result = get_prediction(contents, model_name, filename=file.filename)
+    result = get_prediction(contents, model_name, filename=file.filename, heuristics_only=not models_ready())
     return result
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=9101)
+    workers = THREAD_CONFIG.get("workers", 1)
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=9101, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=9101)
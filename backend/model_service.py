@@ -2,6 +2,8 @@
 Robust Hybrid ML-Heuristic Model Service
 Combines deep learning with visual heuristics to ensure 100% reliable demo results.
 Prevents "same output" bug by cross-verifying ML predictions with image properties.
+TensorFlow is imported on first model load, so the API can start (and answer in
+heuristics-only mode) before the models are ready.
 """
 
 import numpy as np
@@ -9,24 +11,37 @@ from PIL import Image
 import io
 import json
 import os
-import tensorflow as tf
 import hashlib
+import threading
+import time
+from thread_config import configure_tensorflow
 
+_tf = None
 _models_cache = {}
 _class_names = []
+_buffers = threading.local()
+_load_lock = threading.Lock()
+_models_ready = threading.Event()
+_load_error = None
+STARTUP_TIMINGS = {}
+INPUT_SIZE = (224, 224)
 MODELS = {
     "Ensemble": "ensemble_core",
     "EfficientNetV2": "efficientnet_v2",
     "ResNet50V2": "resnet_50_v2",
     "MobileNetV3": "mobilenet_v3"
 }
-def load_models():
-    """Load models lazily and handle missing files gracefully"""
-    global _models_cache, _class_names
-    if _models_cache and _class_names:
-        return _models_cache, _class_names
+MODEL_FILES = {
+    "EfficientNetV2": "efficientnetv2.h5",
+    "ResNet50V2": "resnet50v2.h5",
+    "MobileNetV3": "mobilenetv3.h5"
+}
+def load_class_names():
+    """Class names saved by train_models.py, or the PlantVillage defaults (no TensorFlow needed)"""
+    global _class_names
+    if _class_names:
+        return _class_names
     models_dir = os.path.join(os.path.dirname(__file__), "models")
-    os.makedirs(models_dir, exist_ok=True)    
     class_names_path = os.path.join(models_dir, "class_names.json")
     if os.path.exists(class_names_path):
         with open(class_names_path) as f:
@@ -41,24 +56,84 @@ def load_models():
             "Tomato___Tomato_Yellow_Leaf_Curl_Virus", "Tomato___Tomato_mosaic_virus",
             "Tomato___healthy"
         ]
-    model_files = {
-        "EfficientNetV2": "efficientnetv2.h5",
-        "ResNet50V2": "resnet50v2.h5",
-        "MobileNetV3": "mobilenetv3.h5"
-    }
-    for key, filename in model_files.items():
-        if key in _models_cache: continue
-        path = os.path.join(models_dir, filename)
-        if os.path.exists(path):
-            try:
-                _models_cache[key] = tf.keras.models.load_model(path, compile=False)
-                print(f" Loaded {key}")
-            except Exception as e:
-                print(f" Error loading {key}: {e}")        
+    return _class_names
+def _import_tensorflow():
+    """Import TensorFlow on first use, timing the import and applying the tuned thread pools"""
+    global _tf
+    if _tf is None:
+        start = time.perf_counter()
+        import tensorflow as tf
+        STARTUP_TIMINGS["import_tensorflow"] = time.perf_counter() - start
+        configure_tensorflow(tf)
+        _tf = tf
+    return _tf
+def load_models():
+    """Load models lazily and handle missing files gracefully"""
+    if _models_cache and _class_names:
+        return _models_cache, _class_names
+    with _load_lock:
+        models_dir = os.path.join(os.path.dirname(__file__), "models")
+        os.makedirs(models_dir, exist_ok=True)
+        load_class_names()
+        for key, filename in MODEL_FILES.items():
+            if key in _models_cache: continue
+            path = os.path.join(models_dir, filename)
+            if os.path.exists(path):
+                tf = _import_tensorflow()
+                try:
+                    start = time.perf_counter()
+                    _models_cache[key] = tf.keras.models.load_model(path, compile=False)
+                    STARTUP_TIMINGS[f"load_{key}"] = time.perf_counter() - start
+                    print(f" Loaded {key}")
+                except Exception as e:
+                    print(f" Error loading {key}: {e}")
+    _models_ready.set()
     return _models_cache, _class_names
+def models_ready():
+    """True once load_models has run; until then /predict answers in heuristics-only mode"""
+    return _models_ready.is_set()
+def load_error():
+    """Why background loading failed (e.g. TensorFlow missing or broken), or None"""
+    return _load_error
+def preload_models():
+    """Run from a background thread at API startup: load the models, then print where the startup time went"""
+    global _load_error
+    start = time.perf_counter()
+    try:
+        load_models()
+    except Exception as e:
+        # /predict stays in heuristics-only mode; /health reports the failure instead of "ok"
+        _load_error = f"{type(e).__name__}: {e}"
+        print(f" Error loading models, serving heuristics only: {_load_error}")
+        return
+    STARTUP_TIMINGS["models_ready"] = time.perf_counter() - start
+    print(" Startup timings:")
+    for step, seconds in STARTUP_TIMINGS.items():
+        print(f"   {step:25s} {seconds:7.3f} s")
+def _buffer(name, shape):
+    """Per-thread float32 scratch array, reallocated only when the shape changes"""
+    buf = getattr(_buffers, name, None)
+    if buf is None or buf.shape != shape:
+        buf = np.empty(shape, dtype=np.float32)
+        setattr(_buffers, name, buf)
+    return buf
+def load_image(image_bytes):
+    """Decode to a (224, 224, 3) uint8 array, returned with the original (width, height)"""
+    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    return np.asarray(img.resize(INPUT_SIZE)), img.size
+def to_model_input(img_array, out=None):
+    """
+    Scale a uint8 image to float32 [0, 1] model input.
+    Writes into `out` or a reused (1, 224, 224, 3) per-thread buffer, valid until the next call.
+    """
+    if out is None:
+        out = _buffer("model_input", (1,) + img_array.shape)
+    np.divide(img_array, np.float32(255.0), out=out)
+    return out
 def analyze_visual_heuristics(img_array, filename=""):
     """
     Improved Visual Analysis: Health analysis runs even if plant is pre-identified.
+    Expects the uint8 RGB array from load_image.
     """
     name_lower = filename.lower()
     suggested_plant = None 
@@ -68,8 +143,10 @@ def analyze_visual_heuristics(img_array, filename=""):
         suggested_plant = "Tomato"
     elif any(k in name_lower for k in ["potato", "pota", "potat"]):
         suggested_plant = "Potato"
-    img_pil = Image.fromarray((img_array * 255).astype(np.uint8))
-    hsv = np.array(img_pil.convert("HSV")) / 255.0
+    if img_array.dtype != np.uint8:
+        img_array = (img_array * 255).astype(np.uint8)
+    hsv = _buffer("hsv", img_array.shape)
+    np.divide(np.asarray(Image.fromarray(img_array).convert("HSV")), np.float32(255.0), out=hsv)
     h, s, v = hsv[:,:,0], hsv[:,:,1], hsv[:,:,2]
     mean_h, mean_s, mean_v = np.mean(h), np.mean(s), np.mean(v)
     leaf_mask = (s > 0.15) & (v > 0.15)
@@ -135,15 +212,25 @@ def analyze_visual_heuristics(img_array, filename=""):
         "nudge_type": nudge_type,
         "metrics": {"h": mean_h, "s": leaf_mean_s, "v": leaf_mean_v, "green": green_ratio, "brown": brown_ratio, "var": variance}
     }
-def get_prediction(image_bytes, model_name="Ensemble", filename=""):
+def split_class_label(class_label):
+    """Split a PlantVillage folder label into (plant, disease)"""
+    if "___" in class_label:
+        return tuple(class_label.split("___", 1))
+    if "__" in class_label:
+        return tuple(class_label.split("__", 1))
+    parts = class_label.split("_", 1)
+    return parts[0], parts[1] if len(parts) > 1 else "healthy"
+def get_prediction(image_bytes, model_name="Ensemble", filename="", heuristics_only=False):
     """
     Hybrid Prediction: ML Probabilities + Deterministic Demo Variance
+    With heuristics_only the models are skipped entirely (degraded mode while they load):
+    the label comes from the visual heuristics and label scoring alone.
     """
-    models, class_names = load_models()
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    width, height = img.size
-    img_array = np.array(img.resize((224, 224))) / 255.0
-    input_batch = np.expand_dims(img_array, axis=0)
+    if heuristics_only:
+        models, class_names = {}, load_class_names()
+    else:
+        models, class_names = load_models()
+    img_array, (width, height) = load_image(image_bytes)
     clean_model = model_name.split(" ")[0].strip()
     if "(" in clean_model: clean_model = clean_model.split("(")[0].strip()
     img_hash = int(hashlib.md5(image_bytes).hexdigest(), 16)
@@ -158,19 +245,28 @@ def get_prediction(image_bytes, model_name="Ensemble", filename=""):
         elif 0.95 < aspect < 1.1: 
             visual["suggested_plant"] = "Potato"    
     predictions = {}
-    for name in ["EfficientNetV2", "ResNet50V2", "MobileNetV3"]:
-        if name in models:
-            try:
-                raw_pred = models[name].predict(input_batch, verbose=0)[0]
-                predictions[name] = raw_pred
-            except:
-                predictions[name] = np.random.dirichlet(np.ones(len(class_names)), size=1)[0]
-        else:
-            predictions[name] = np.random.dirichlet(np.ones(len(class_names)), size=1)[0]
-    if model_name == "Ensemble":
-        combined_pred = np.mean(list(predictions.values()), axis=0)
+    if heuristics_only:
+        # Flat prior: the argmax is decided by variety_score alone
+        combined_pred = np.full(len(class_names), 1.0 / len(class_names), dtype=np.float32)
     else:
-        combined_pred = predictions.get(model_name, list(predictions.values())[0])
+        # One float32 row per model; the Dirichlet fallback writes into the same rows
+        input_batch = to_model_input(img_array)
+        model_names = ["EfficientNetV2", "ResNet50V2", "MobileNetV3"]
+        pred_rows = _buffer("predictions", (len(model_names), len(class_names)))
+        alpha = np.ones(len(class_names))
+        for row, name in zip(pred_rows, model_names):
+            if name in models:
+                try:
+                    row[:] = models[name].predict(input_batch, verbose=0)[0]
+                except:
+                    row[:] = np.random.dirichlet(alpha)
+            else:
+                row[:] = np.random.dirichlet(alpha)
+            predictions[name] = row
+        if model_name == "Ensemble":
+            combined_pred = pred_rows.mean(axis=0)
+        else:
+            combined_pred = predictions.get(model_name, list(predictions.values())[0])
     variety_score = np.zeros(len(class_names))
     target_plant = visual["suggested_plant"].lower()
     for i, label in enumerate(class_names):
@@ -200,9 +296,9 @@ def get_prediction(image_bytes, model_name="Ensemble", filename=""):
     class_label = class_names[class_idx]
     
     if "Ensemble" in model_name: 
-        raw_prob = combined_pred[class_idx]
+        raw_prob = float(combined_pred[class_idx])
     else:
-        raw_prob = predictions.get(clean_model, combined_pred)[class_idx]
+        raw_prob = float(predictions.get(clean_model, combined_pred)[class_idx])
     
     display_confidence = 75.0 + (raw_prob * 24.9)
     if "MobileNet" in clean_model: 
@@ -214,15 +310,7 @@ def get_prediction(image_bytes, model_name="Ensemble", filename=""):
          display_confidence += 2.0 
          
     display_confidence = min(99.95, max(75.0, display_confidence))
-    if "___" in class_label:
-        plant, disease = class_label.split("___", 1)
-    elif "__" in class_label:
-        plant, disease = class_label.split("__", 1)
-    else:
-        parts = class_label.split("_", 1)
-        plant = parts[0]
-        disease = parts[1] if len(parts) > 1 else "healthy"
-        
+    plant, disease = split_class_label(class_label)
     plant_clean = plant.replace("__", " ").replace("_", " ").strip()
     disease_clean = disease.replace("_", " ").strip()
     
@@ -235,7 +323,7 @@ def get_prediction(image_bytes, model_name="Ensemble", filename=""):
     breakdown = {}
     for mod_name, pred_arr in predictions.items():
         # Raw probability of the WINNING class
-        p_val = pred_arr[class_idx]
+        p_val = float(pred_arr[class_idx])
         
         # Scale for display
         b_score = 75.0 + (p_val * 24.9)
@@ -258,7 +346,8 @@ def get_prediction(image_bytes, model_name="Ensemble", filename=""):
         "accuracy": round(display_confidence, 2),
         "description": info["description"],
         "treatment": info["treatment"],
-        "confidence_breakdown": breakdown
+        "confidence_breakdown": breakdown,
+        "degraded": heuristics_only
     }
 
 def get_disease_info(plant, disease):
@@ -0,0 +1,50 @@
+"""
+CPU Threading Configuration
+Reads the settings written by tune_threads.py and applies them to the current process.
+Deliberately free of numpy/TensorFlow imports: thread counts passed through environment
+variables only take effect if they are set before those libraries load.
+"""
+
+import json
+import os
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "models", "thread_config.json")
+BLAS_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"]
+
+
+def load_thread_config(path=CONFIG_PATH):
+    """Tuned settings, or {} when the tuner has not been run (library defaults apply)"""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except Exception as e:
+        print(f" Ignoring {path}: {e}")
+        return {}
+
+
+def apply_env(config):
+    """Export the tuned thread counts; variables already set in the environment take precedence"""
+    env = {}
+    if "blas_threads" in config:
+        env.update({var: str(config["blas_threads"]) for var in BLAS_ENV_VARS})
+    if "intra_op_threads" in config:
+        env["TF_NUM_INTRAOP_THREADS"] = str(config["intra_op_threads"])
+    if "inter_op_threads" in config:
+        env["TF_NUM_INTEROP_THREADS"] = str(config["inter_op_threads"])
+    for var, value in env.items():
+        os.environ.setdefault(var, value)
+
+
+def configure_tensorflow(tf):
+    """Size TensorFlow's thread pools from TF_NUM_INTRAOP_THREADS / TF_NUM_INTEROP_THREADS before the first op runs"""
+    intra = os.environ.get("TF_NUM_INTRAOP_THREADS")
+    inter = os.environ.get("TF_NUM_INTEROP_THREADS")
+    try:
+        if intra:
+            tf.config.threading.set_intra_op_parallelism_threads(int(intra))
+        if inter:
+            tf.config.threading.set_inter_op_parallelism_threads(int(inter))
+    except RuntimeError as e:
+        print(f" Thread settings not applied: {e}")
@@ -0,0 +1,268 @@
+"""
+CPU Threading Auto-Tuner
+Sweeps TensorFlow intra-op/inter-op threads, batch sizes and worker processes for each model
+on this host and measures throughput and latency. The best configuration is written to
+models/thread_config.json, which main.py applies at startup.
+Every thread setting runs in fresh processes: TensorFlow fixes its thread pools on first use.
+"""
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import time
+from queue import Empty
+
+from thread_config import CONFIG_PATH, BLAS_ENV_VARS
+
+# NumPy only does light elementwise work in the service, so BLAS is pinned to one thread
+# to keep it from competing with TensorFlow's pools
+BLAS_THREADS = 1
+# Every worker process imports TensorFlow and loads the models, so the default sweep stays small
+MAX_DEFAULT_WORKERS = 8
+# Rough time for one trial's processes to import TensorFlow and load the models, used for the estimate
+STARTUP_ESTIMATE_S = 20
+
+
+def _counts(limit):
+    """1, 2, 4, ... up to and including limit"""
+    counts = []
+    n = 1
+    while n < limit:
+        counts.append(n)
+        n *= 2
+    return counts + [limit]
+
+
+def _available_memory_mb():
+    """Free physical memory, or None where sysconf cannot tell (e.g. Windows)"""
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def _bench_worker(model_key, intra, inter, batch_sizes, duration, barrier, queue):
+    """Run inside a spawned process: time back-to-back inference for each batch size"""
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(intra)
+    os.environ["TF_NUM_INTEROP_THREADS"] = str(inter)
+    os.environ.update({var: str(BLAS_THREADS) for var in BLAS_ENV_VARS})
+    try:
+        import numpy as np
+        import model_service
+        models, _ = model_service.load_models()
+        # Ensemble runs every loaded model per request, like get_prediction does
+        selected = list(models.values()) if model_key == "Ensemble" else [models[model_key]]
+        rng = np.random.default_rng(0)
+        results = {}
+        for batch_size in batch_sizes:
+            input_batch = rng.random((batch_size,) + model_service.INPUT_SIZE + (3,), dtype=np.float32)
+            for model in selected:
+                model.predict(input_batch, batch_size=batch_size, verbose=0)
+            barrier.wait()
+            latencies = []
+            start = time.perf_counter()
+            while time.perf_counter() - start < duration:
+                t = time.perf_counter()
+                for model in selected:
+                    model.predict(input_batch, batch_size=batch_size, verbose=0)
+                latencies.append((time.perf_counter() - t) * 1000)
+            results[batch_size] = (latencies, time.perf_counter() - start)
+        queue.put(results)
+    except Exception as e:
+        barrier.abort()
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def run_trial(model_key, intra, inter, workers, batch_sizes, duration):
+    """Run `workers` concurrent processes with one thread setting; one result row per batch size"""
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    queue = ctx.Queue()
+    procs = [
+        ctx.Process(target=_bench_worker, args=(model_key, intra, inter, batch_sizes, duration, barrier, queue))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    results = []
+    errors = []
+    while len(results) < len(procs):
+        try:
+            results.append(queue.get(timeout=1))
+        except Empty:
+            # A process killed by the OS (OOM, segfault) never reports back; the rest then wait at the barrier
+            exited = [p for p in procs if p.exitcode is not None]
+            if len(exited) > len(results):
+                errors.append(f"benchmark process exited without a result (exit code {exited[0].exitcode})")
+                break
+    for p in procs:
+        if p.is_alive():
+            p.terminate()
+        p.join()
+    errors += [r["error"] for r in results if "error" in r]
+    if errors:
+        print(f"   Trial failed: {errors[0]}")
+        return []
+    rows = []
+    for batch_size in batch_sizes:
+        latencies = sorted(l for r in results for l in r[batch_size][0])
+        wall = max(r[batch_size][1] for r in results)
+        rows.append({
+            "model": model_key,
+            "intra_op_threads": intra,
+            "inter_op_threads": inter,
+            "workers": workers,
+            "batch_size": batch_size,
+            "images_per_s": round(len(latencies) * batch_size / wall, 2),
+            "latency_ms_p50": round(latencies[len(latencies) // 2], 2),
+            "latency_ms_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        })
+    return rows
+
+
+def pick_best(rows, latency_budget_ms=None):
+    """
+    Serving setting: highest throughput at the smallest batch size (the API scores one image
+    per request) within the p95 budget. Batch size: the fastest one under that thread setting.
+    The last value is False when no setting met the budget (the fastest one is returned anyway).
+    """
+    serving_batch = min(r["batch_size"] for r in rows)
+    candidates = [r for r in rows if r["batch_size"] == serving_batch]
+    within_budget = True
+    if latency_budget_ms is not None:
+        in_budget = [r for r in candidates if r["latency_ms_p95"] <= latency_budget_ms]
+        within_budget = bool(in_budget)
+        candidates = in_budget or candidates
+    serving = max(candidates, key=lambda r: (r["images_per_s"], -r["latency_ms_p95"]))
+    same_threads = [
+        r for r in rows
+        if (r["intra_op_threads"], r["inter_op_threads"], r["workers"])
+        == (serving["intra_op_threads"], serving["inter_op_threads"], serving["workers"])
+    ]
+    batch = max(same_threads, key=lambda r: r["images_per_s"])
+    return serving, batch, within_budget
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Find the best TensorFlow threading setup for this host")
+    parser.add_argument("--models", default=None,
+                        help="Comma-separated subset of models to tune (default: every trained model plus Ensemble)")
+    parser.add_argument("--intra", type=_int_list, default=_counts(cpus), help="Intra-op thread counts to try")
+    parser.add_argument("--inter", type=_int_list, default=[1, 2], help="Inter-op thread counts to try")
+    parser.add_argument("--workers", type=_int_list, default=None,
+                        help=f"Worker process counts to try (default: 1, 2, 4, ... up to the CPU count, "
+                             f"at most {MAX_DEFAULT_WORKERS} and what free memory allows)")
+    parser.add_argument("--process-memory-mb", type=int, default=1500,
+                        help="Memory one process with TensorFlow and the models needs, used to cap the default workers")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds measured per batch size")
+    parser.add_argument("--latency-budget-ms", type=float, default=None,
+                        help="Only pick serving settings whose p95 latency is within this budget")
+    parser.add_argument("--allow-oversubscribe", action="store_true",
+                        help="Also try settings where workers x intra-op threads exceeds the CPU count")
+    parser.add_argument("--output", default=CONFIG_PATH)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(" Plant Disease Detection - CPU Threading Auto-Tuner")
+    print("=" * 60)
+    from model_service import MODEL_FILES
+    models_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+    available = [k for k, f in MODEL_FILES.items() if os.path.exists(os.path.join(models_dir, f))]
+    if not available:
+        print("\n No trained models found in models/")
+        print("   Run: python train_models.py")
+        exit(1)
+    model_keys = args.models.split(",") if args.models else available + ["Ensemble"]
+    missing = [k for k in model_keys if k != "Ensemble" and k not in available]
+    if missing:
+        print(f"\n No trained weights for: {', '.join(missing)}")
+        exit(1)
+
+    if args.workers is None:
+        max_workers = min(cpus, MAX_DEFAULT_WORKERS)
+        memory_mb = _available_memory_mb()
+        if memory_mb is not None:
+            max_workers = max(1, min(max_workers, memory_mb // args.process_memory_mb))
+        args.workers = _counts(max_workers)
+    settings = [
+        (intra, inter, workers)
+        for workers in args.workers
+        for intra in args.intra
+        for inter in args.inter
+        if args.allow_oversubscribe or workers * intra <= cpus
+    ]
+    print(f"\n Host: {cpus} CPUs, {platform.processor() or platform.machine()}")
+    print(f"   {len(settings)} thread settings x {len(args.batch_sizes)} batch sizes x {len(model_keys)} models")
+    print(f"   Worker counts: {', '.join(str(w) for w in args.workers)}")
+    total_trials = len(settings) * len(model_keys)
+    trial_estimate = STARTUP_ESTIMATE_S + len(args.batch_sizes) * args.duration
+    print(f"   Estimated time: ~{total_trials * trial_estimate / 60:.0f} min "
+          f"({total_trials} trials x ~{trial_estimate:.0f} s, assuming ~{STARTUP_ESTIMATE_S} s to load TensorFlow per trial)")
+
+    sweep = []
+    best = {}
+    done = 0
+    sweep_start = time.perf_counter()
+    for model_key in model_keys:
+        print(f"\n Tuning {model_key}...")
+        rows = []
+        for intra, inter, workers in settings:
+            trial = run_trial(model_key, intra, inter, workers, args.batch_sizes, args.duration)
+            done += 1
+            remaining = (time.perf_counter() - sweep_start) / done * (total_trials - done)
+            print(f"   [{done}/{total_trials}] ~{remaining / 60:.1f} min left")
+            for r in trial:
+                print(f"   intra={intra:<3d} inter={inter:<2d} workers={workers:<3d} batch={r['batch_size']:<3d} "
+                      f"{r['images_per_s']:8.2f} img/s  p50 {r['latency_ms_p50']:7.2f} ms  p95 {r['latency_ms_p95']:7.2f} ms")
+            rows += trial
+        if not rows:
+            print(f"   No successful trials for {model_key}")
+            continue
+        sweep += rows
+        serving, batch, within_budget = pick_best(rows, args.latency_budget_ms)
+        best[model_key] = {"serving": serving, "batch": batch, "within_budget": within_budget}
+        if not within_budget:
+            print(f"   Warning: no setting met the {args.latency_budget_ms} ms p95 budget for {model_key}")
+        print(f"   Best: intra={serving['intra_op_threads']} inter={serving['inter_op_threads']} "
+              f"workers={serving['workers']}, batch size {batch['batch_size']}")
+    if not best:
+        print("\n All trials failed, nothing written")
+        exit(1)
+
+    # The server runs the ensemble by default, so its result decides the process-wide setting
+    chosen = best.get("Ensemble") or next(iter(best.values()))
+    if not chosen["within_budget"]:
+        print(f"\n No setting met the {args.latency_budget_ms} ms p95 budget "
+              f"(best p95 was {chosen['serving']['latency_ms_p95']} ms), nothing written")
+        print("   Raise --latency-budget-ms or drop it to keep the fastest setting")
+        exit(1)
+    config = {
+        "intra_op_threads": chosen["serving"]["intra_op_threads"],
+        "inter_op_threads": chosen["serving"]["inter_op_threads"],
+        "blas_threads": BLAS_THREADS,
+        "workers": chosen["serving"]["workers"],
+        "batch_size": chosen["batch"]["batch_size"],
+        "host": {"cpus": cpus, "machine": platform.machine(), "processor": platform.processor()},
+        "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "best": best,
+        "sweep": sweep,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(config, f, indent=2)
+    print(f"\n Saved configuration to {args.output}")
+    print(f"   intra-op {config['intra_op_threads']}, inter-op {config['inter_op_threads']}, "
+          f"workers {config['workers']}, batch size {config['batch_size']}")
+    print("\n Next: restart the API (python main.py) to apply it")
+
+
+if __name__ == "__main__":
+    main()